@@ -4,15 +4,17 @@ Lazy imports = instant startup, no blocking
 """
 
 import asyncio
-import json
+import hashlib
 import os
+import socket
 import sys
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Set
 from pathlib import Path
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+import msgspec
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, FileResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 
@@ -22,9 +24,23 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 # Langchain / ChromaDB / RAG are imported lazily on first request
 # This cuts startup from 20-40s down to ~2s
 
-from backend.pathway_stream import get_processor, CITIES_CONFIG
+from backend.pathway_stream import get_processor, Batch, CITIES_CONFIG, INTERVAL
 
-app = FastAPI(title="GreenPulse", version="1.0.0")
+_json_encoder = msgspec.json.Encoder()
+
+
+class MsgspecJSONResponse(JSONResponse):
+    """JSONResponse rendered by msgspec instead of the stdlib json module."""
+
+    def render(self, content: Any) -> bytes:
+        return _json_encoder.encode(content)
+
+
+app = FastAPI(
+    title="GreenPulse",
+    version="1.0.0",
+    default_response_class=MsgspecJSONResponse,
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -34,10 +50,108 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-_latest: Dict[str, Any] = {}
-_ws_clients: List[WebSocket] = []
+_latest: Optional[Batch] = None
+_ws_clients: Set[WebSocket] = set()
 _active_cities = list(CITIES_CONFIG.keys())
 _rag = None  # loaded lazily
+_rag_loading = asyncio.Lock()  # held while a preload is importing the RAG stack
+_rag_loaded = asyncio.Event()  # set once imported and init started — not once ready
+
+# Optional Redis pub/sub so broadcasts reach clients on every uvicorn worker
+REDIS_URL = os.getenv("REDIS_URL", "")
+PULSE_CHANNEL = "greenpulse:pulse"
+LATEST_KEY = "greenpulse:latest"  # last published batch, for workers that (re)subscribe late
+_redis = None  # redis.asyncio client, created at startup when REDIS_URL is set
+
+# Only the worker holding this lease fetches from WAQI; the TTL leaves room
+# for one missed tick plus a slow fetch before another worker takes over
+LEADER_KEY = "greenpulse:leader"
+_LEASE_TTL = int(INTERVAL * 2) + 15
+_WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+_RENEW_LEASE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('expire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+_RELEASE_LEASE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# Wire formats for /ws/stream — JSON text frames by default, msgpack binary
+# frames for clients connecting with ?fmt=msgpack
+_msgpack_encoder = msgspec.msgpack.Encoder()
+_batch_decoder = msgspec.json.Decoder(Batch)
+_WS_FORMATS = ("json", "msgpack")
+_WS_SEND_TIMEOUT = 5.0  # seconds before a stalled client is treated as dead
+
+# Encoded forms of _latest, refreshed only when stream_loop produces a batch
+_EMPTY_SNAPSHOT = _json_encoder.encode({"readings": [], "cities": {}})
+_latest_json: bytes = b""
+_latest_builtins: Dict[str, Any] = {}  # plain-dict view for the RAG prompt
+_latest_frames: Dict[str, Any] = {}
+_latest_etag = ""
+_last_digest = b""  # digest of the last published readings, for dedup
+
+# CITIES_CONFIG is immutable, so the /api/cities body is built once
+_CITIES_JSON = _json_encoder.encode({
+    "cities": [
+        {"name": n, "stations": len(c["stations"]), "color": c["color"], "emoji": c["emoji"]}
+        for n, c in CITIES_CONFIG.items()
+    ]
+})
+
+
+def _etag(body: bytes) -> str:
+    # Content hash, so every worker derives the same tag for the same batch
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+_CITIES_ETAG = _etag(_CITIES_JSON)
+_EMPTY_SNAPSHOT_ETAG = _etag(_EMPTY_SNAPSHOT)
+
+
+def _cached_json(request: Request, body: bytes, etag: str, max_age: int) -> Response:
+    """Pre-encoded JSON body with validators; 304 when the client's copy is current."""
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={max_age}"}
+    if etag in (t.strip() for t in request.headers.get("if-none-match", "").split(",")):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+def _latest_frame(fmt: str):
+    """Websocket update frame for _latest, encoded at most once per format."""
+    frame = _latest_frames.get(fmt)
+    if frame is None:
+        if fmt == "msgpack":
+            frame = _msgpack_encoder.encode({"type": "update", "data": _latest})
+        else:
+            # Splice the already-encoded batch into a fixed envelope
+            frame = (b'{"type":"update","data":' + _latest_json + b"}").decode()
+        _latest_frames[fmt] = frame
+    return frame
+
+
+async def _send_frame(ws: WebSocket, frame) -> None:
+    if isinstance(frame, bytes):
+        send = ws.send_bytes(frame)
+    else:
+        send = ws.send_text(frame)
+    await asyncio.wait_for(send, timeout=_WS_SEND_TIMEOUT)
+
+
+async def _drop_client(ws: WebSocket) -> None:
+    """Unregister a client whose send failed and close it so it reconnects."""
+    _ws_clients.discard(ws)
+    try:
+        # A timed-out send may have left a partial frame on the wire;
+        # closing ends ws_endpoint's receive loop too
+        await asyncio.wait_for(ws.close(code=1011), timeout=_WS_SEND_TIMEOUT)
+    except Exception:
+        pass
 
 
 def get_rag_lazy():
@@ -49,55 +163,174 @@ def get_rag_lazy():
     return _rag
 
 
+async def _load_rag_once():
+    """Import the RAG stack in the default executor and start its init, one load at a time."""
+    async with _rag_loading:
+        if _rag_loaded.is_set():
+            return
+        try:
+            rag = await asyncio.to_thread(get_rag_lazy)
+            rag.start()
+            _rag_loaded.set()
+        except Exception:
+            pass
+
+
+async def _ensure_rag():
+    """The RAG instance, importing it off the event loop on first use."""
+    await _load_rag_once()
+    if _rag is None:
+        # Background load failed — retry here so the caller sees the error
+        return await asyncio.to_thread(get_rag_lazy)
+    return _rag
+
+
 # ── Streaming Loop ─────────────────────────────────────────────────
+async def broadcast(batch: Batch, encoded: bytes = b"") -> None:
+    """Make batch the current snapshot and push it to this worker's clients."""
+    global _latest, _latest_json, _latest_builtins, _latest_frames, _latest_etag
+    _latest = batch
+    _latest_json = encoded or _json_encoder.encode(batch)
+    _latest_builtins = msgspec.to_builtins(batch)
+    _latest_frames = {}
+    _latest_etag = _etag(_latest_json)
+    clients = list(_ws_clients)
+    # Fan out concurrently so one slow socket can't stall the others;
+    # each format is encoded once and the frame reused for every client
+    results = await asyncio.gather(
+        *(_send_frame(ws, _latest_frame(ws.state.fmt)) for ws in clients),
+        return_exceptions=True,
+    )
+    failed = [ws for ws, res in zip(clients, results) if isinstance(res, BaseException)]
+    if failed:
+        await asyncio.gather(*(_drop_client(ws) for ws in failed))
+
+
+async def publish(batch: Batch) -> None:
+    """Hand a new batch to every worker's clients (or just ours without Redis)."""
+    if _redis is None:
+        await broadcast(batch)
+        return
+    encoded = _json_encoder.encode(batch)
+    try:
+        # Every worker — this one included — picks it up in relay_loop
+        async with _redis.pipeline(transaction=True) as pipe:
+            pipe.set(LATEST_KEY, encoded)
+            pipe.publish(PULSE_CHANNEL, encoded)
+            await pipe.execute()
+    except Exception as e:
+        print(f"⚠️  Redis publish failed, broadcasting locally: {e}")
+        await broadcast(batch, encoded)
+
+
 async def stream_loop():
+    global _last_digest
     processor = get_processor(_active_cities)
     async for batch in processor.start():
-        global _latest
-        _latest = batch
-        payload = json.dumps({"type": "update", "data": batch})
-        dead = []
-        for ws in list(_ws_clients):
-            try:
-                await ws.send_text(payload)
-            except Exception:
-                dead.append(ws)
-        for ws in dead:
-            if ws in _ws_clients:
-                _ws_clients.remove(ws)
+        # WAQI stations refresh far less often than we poll; skip batches
+        # whose readings are unchanged (the batch timestamp always differs)
+        digest = hashlib.blake2b(_json_encoder.encode(batch.readings), digest_size=16).digest()
+        if digest != _last_digest:
+            _last_digest = digest
+            await publish(batch)
+        if _redis is not None and not await _renew_lease():
+            print(f"⚠️  {_WORKER_ID} lost the stream lease, stopping fetch loop")
+            return
+
+
+async def _renew_lease() -> bool:
+    """Extend our leader lease; False only if another worker now holds it."""
+    try:
+        return bool(await _redis.eval(_RENEW_LEASE, 1, LEADER_KEY, _WORKER_ID, _LEASE_TTL))
+    except Exception as e:
+        print(f"⚠️  Redis lease renewal failed: {e}")
+        return True
+
+
+async def _acquire_lease() -> bool:
+    """Take the leader lease, or extend it if this worker already holds it."""
+    if await _redis.set(LEADER_KEY, _WORKER_ID, nx=True, ex=_LEASE_TTL):
+        return True
+    # Our own key is still live when stream_loop raised — don't wait out the TTL
+    return bool(await _redis.eval(_RENEW_LEASE, 1, LEADER_KEY, _WORKER_ID, _LEASE_TTL))
+
+
+async def leader_loop():
+    """Run stream_loop on whichever worker currently holds the Redis lease."""
+    while True:
+        try:
+            if await _acquire_lease():
+                print(f"✅ {_WORKER_ID} is the stream leader")
+                await stream_loop()
+        except Exception as e:
+            print(f"⚠️  Stream leader error: {e}")
+        await asyncio.sleep(INTERVAL)
+
+
+async def relay_loop():
+    """Forward batches published on Redis to this worker's websocket clients."""
+    while True:
+        try:
+            async with _redis.pubsub() as pubsub:
+                await pubsub.subscribe(PULSE_CHANNEL)
+                # Dedup means the next publish may be an hour away, so seed
+                # from the stored batch; anything newer arrives on the channel
+                data = await _redis.get(LATEST_KEY)
+                if data and data != _latest_json:
+                    await broadcast(_batch_decoder.decode(data), data)
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        data = message["data"]
+                        await broadcast(_batch_decoder.decode(data), data)
+        except Exception as e:
+            print(f"⚠️  Redis relay error: {e}")
+            await asyncio.sleep(1.0)
 
 
 @app.on_event("startup")
 async def startup():
+    global _redis
     # Kick off RAG loading in background immediately at startup
     # so it's ready by the time user opens browser
-    def _preload_rag():
-        try:
-            get_rag_lazy()
-        except Exception:
-            pass
-    import threading
-    threading.Thread(target=_preload_rag, daemon=True).start()
-
-    asyncio.create_task(stream_loop())
+    asyncio.create_task(_load_rag_once())
+
+    if REDIS_URL:
+        import redis.asyncio as aioredis
+        _redis = aioredis.from_url(REDIS_URL)
+        asyncio.create_task(relay_loop())
+        asyncio.create_task(leader_loop())
+        print("✅ Redis pub/sub enabled for websocket broadcast")
+    else:
+        asyncio.create_task(stream_loop())
     print("✅ GreenPulse streaming started")
 
 
+@app.on_event("shutdown")
+async def shutdown():
+    if _redis is not None:
+        try:
+            # Hand the lease over now instead of leaving followers idle until it expires
+            await _redis.eval(_RELEASE_LEASE, 1, LEADER_KEY, _WORKER_ID)
+        except Exception as e:
+            print(f"⚠️  Redis lease release failed: {e}")
+        await _redis.aclose()
+
+
 # ── WebSocket ──────────────────────────────────────────────────────
 @app.websocket("/ws/stream")
-async def ws_endpoint(websocket: WebSocket):
+async def ws_endpoint(websocket: WebSocket, fmt: str = "json"):
     await websocket.accept()
-    _ws_clients.append(websocket)
-    if _latest:
-        await websocket.send_text(json.dumps({"type": "update", "data": _latest}))
+    websocket.state.fmt = fmt if fmt in _WS_FORMATS else "json"
+    _ws_clients.add(websocket)
     try:
+        if _latest is not None:
+            await _send_frame(websocket, _latest_frame(websocket.state.fmt))
         while True:
             msg = await websocket.receive_text()
             if msg == "ping":
                 await websocket.send_text("pong")
     except (WebSocketDisconnect, Exception):
-        if websocket in _ws_clients:
-            _ws_clients.remove(websocket)
+        _ws_clients.discard(websocket)
 
 
 # ── REST ───────────────────────────────────────────────────────────
@@ -107,18 +340,15 @@ def root():
 
 
 @app.get("/api/snapshot")
-def snapshot():
-    return _latest or {"readings": [], "cities": {}}
+def snapshot(request: Request):
+    if not _latest_json:
+        return _cached_json(request, _EMPTY_SNAPSHOT, _EMPTY_SNAPSHOT_ETAG, max_age=30)
+    return _cached_json(request, _latest_json, _latest_etag, max_age=30)
 
 
 @app.get("/api/cities")
-def get_cities():
-    return {
-        "cities": [
-            {"name": n, "stations": len(c["stations"]), "color": c["color"], "emoji": c["emoji"]}
-            for n, c in CITIES_CONFIG.items()
-        ]
-    }
+def get_cities(request: Request):
+    return _cached_json(request, _CITIES_JSON, _CITIES_ETAG, max_age=3600)
 
 
 class CitySelection(BaseModel):
@@ -138,16 +368,24 @@ class ChatRequest(BaseModel):
     question: str
 
 
+def _live_snapshot() -> Dict[str, Any]:
+    """Latest batch as plain dicts — the shape the RAG prompt builder reads.
+    Built once per batch in broadcast(); treat it as read-only."""
+    return _latest_builtins
+
+
 @app.post("/api/chat/stream")
 async def chat_stream(req: ChatRequest):
-    rag = get_rag_lazy()
-    live = _latest or {}
+    rag = await _ensure_rag()
+    live = _live_snapshot()
 
     async def generate():
         async for token in rag.query_stream(req.question, live):
-            yield f"data: {json.dumps({'token': token})}\n\n"
+            # Encode just the string and splice it into a fixed frame —
+            # no per-token dict to build or walk
+            yield b'data: {"token":' + _json_encoder.encode(token) + b"}\n\n"
         sources = rag.get_sources(req.question)
-        yield f"data: {json.dumps({'done': True, 'sources': sources})}\n\n"
+        yield b"data: " + _json_encoder.encode({"done": True, "sources": sources}) + b"\n\n"
 
     return StreamingResponse(
         generate(),
@@ -158,8 +396,8 @@ async def chat_stream(req: ChatRequest):
 
 @app.post("/api/chat")
 async def chat(req: ChatRequest):
-    rag = get_rag_lazy()
-    live = _latest or {}
+    rag = await _ensure_rag()
+    live = _live_snapshot()
     answer = ""
     async for token in rag.query_stream(req.question, live):
         answer += token
@@ -179,15 +417,14 @@ def rag_status():
 
 
 @app.post("/api/rag/preload")
-def preload_rag():
-    """Trigger RAG loading on page load so it's ready when user wants to chat."""
-    def _trigger_load():
-        try:
-            get_rag_lazy()
-        except Exception:
-            pass
-    import threading
-    threading.Thread(target=_trigger_load, daemon=True).start()
+async def preload_rag():
+    """Trigger RAG loading on page load so it's ready when user wants to chat.
+    Init continues in the background; poll /api/rag/status for readiness."""
+    if _rag_loaded.is_set():
+        return {"status": "loaded"}
+    if _rag_loading.locked():
+        return {"status": "loading"}
+    asyncio.create_task(_load_rag_once())
     return {"status": "loading_triggered"}
 
 
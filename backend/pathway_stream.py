@@ -7,9 +7,10 @@ No simulation — 100% real-time data from CPCB/WAQI stations.
 import os
 import asyncio
 import httpx
+import msgspec
 from datetime import datetime
+from types import MappingProxyType
 from typing import Dict, List, Optional
-import pandas as pd
 
 # Pathway pip package is a stub on Python 3.13/Windows — not functional
 # All streaming logic implemented natively below (rolling windows, anomaly detection)
@@ -17,37 +18,117 @@ PATHWAY_AVAILABLE = False
 
 WAQI_TOKEN = os.getenv("WAQI_TOKEN", "demo")
 INTERVAL = float(os.getenv("REFRESH_INTERVAL", "60"))
+WAQI_BASE_URL = "https://api.waqi.info"
 
-# 5 Cities with real WAQI stations
-CITIES_CONFIG = {
-    "Delhi": {
-        "stations": ["delhi/anand-vihar", "delhi/punjabi-bagh", "delhi/ito", "delhi/dwarka-sector-8"],
+# 5 Cities with real WAQI stations — read-only all the way down, so the
+# lookups derived from it below can never drift out of sync
+CITIES_CONFIG = MappingProxyType({
+    "Delhi": MappingProxyType({
+        "stations": ("delhi/anand-vihar", "delhi/punjabi-bagh", "delhi/ito", "delhi/dwarka-sector-8"),
         "color": "#7fff00",
         "emoji": "🏛"
-    },
-    "Mumbai": {
-        "stations": ["mumbai/bandra-kurla", "mumbai/chembur", "mumbai/worli", "mumbai/navi-mumbai"],
+    }),
+    "Mumbai": MappingProxyType({
+        "stations": ("mumbai/bandra-kurla", "mumbai/chembur", "mumbai/worli", "mumbai/navi-mumbai"),
         "color": "#38bdf8",
         "emoji": "🌊"
-    },
-    "Kolkata": {
-        "stations": ["kolkata/rabindra-bharati", "kolkata/victoria", "kolkata/ballygunge", "kolkata/jadavpur"],
+    }),
+    "Kolkata": MappingProxyType({
+        "stations": ("kolkata/rabindra-bharati", "kolkata/victoria", "kolkata/ballygunge", "kolkata/jadavpur"),
         "color": "#f5a623",
         "emoji": "⚓"
-    },
-    "Chennai": {
-        "stations": ["chennai/alandur", "chennai/manali", "chennai/velachery", "chennai/kodungaiyur"],
+    }),
+    "Chennai": MappingProxyType({
+        "stations": ("chennai/alandur", "chennai/manali", "chennai/velachery", "chennai/kodungaiyur"),
         "color": "#c084fc",
         "emoji": "🌴"
-    },
-    "Prayagraj": {
-        "stations": ["allahabad/nh-27,-prayagraj", "allahabad/civil-lines-prayagraj"],
+    }),
+    "Prayagraj": MappingProxyType({
+        "stations": ("allahabad/nh-27,-prayagraj", "allahabad/civil-lines-prayagraj"),
         "color": "#ff6b6b",
         "emoji": "🕉"
-    },
+    }),
+})
+
+# Static lookups derived from CITIES_CONFIG once, so the per-tick path only
+# does tuple unpacking instead of nested dict gets and string formatting
+_DEFAULT_META = ("#7fff00", "🌿")
+_CITY_META = {name: (cfg["color"], cfg["emoji"]) for name, cfg in CITIES_CONFIG.items()}
+_CITY_STATIONS = {
+    name: tuple(
+        (f"{name[:2].upper()}{i+1}", station) for i, station in enumerate(cfg["stations"])
+    )
+    for name, cfg in CITIES_CONFIG.items()
+}
+_STATION_URL = {
+    station: f"{WAQI_BASE_URL}/feed/{station}/?token={WAQI_TOKEN}"
+    for stations in _CITY_STATIONS.values()
+    for _, station in stations
 }
 
 
+class Reading(msgspec.Struct):
+    """One station's reading, as streamed to clients."""
+    zone_id: str
+    zone_name: str
+    city: str
+    timestamp: str
+    aqi: float
+    pm25: float
+    pm10: float
+    no2: float
+    so2: float
+    o3: float
+    co: float
+    co2_kg_hr: float = 0.0
+    data_source: str = "live"
+
+
+class CityStats(msgspec.Struct):
+    """Per-city aggregates for one batch."""
+    total_co2: float
+    avg_aqi: float
+    avg_pm25: float
+    count: int
+    color: str
+    emoji: str
+
+
+class Batch(msgspec.Struct):
+    """One processed tick: every reading plus city and overall aggregates."""
+    timestamp: str
+    readings: List[Reading]
+    total_co2: float = 0.0
+    avg_aqi: float = 0.0
+    cities: Dict[str, CityStats] = {}
+    data_source: str = "live"
+
+
+# Placeholder values WAQI uses for a missing sensor reading
+_MISSING = frozenset((None, "-", "", "NA", "N/A"))
+
+
+def _safe_float(val, fallback=0.0):
+    """WAQI sometimes returns '-' or None for missing sensor readings."""
+    if type(val) is float:
+        return val
+    try:
+        if val in _MISSING:
+            return fallback
+        return float(val)
+    except (ValueError, TypeError):
+        return fallback
+
+
+def _iaqi_value(iaqi: Dict, key: str) -> float:
+    """Individual pollutant value from a WAQI iaqi block, 0.0 if absent."""
+    try:
+        raw = iaqi[key]["v"]
+    except (KeyError, TypeError):
+        return 0.0
+    return _safe_float(raw)
+
+
 class WAQIConnector:
     """Pathway connector for WAQI live data streams."""
     
@@ -56,20 +137,34 @@ class WAQIConnector:
         self.client: Optional[httpx.AsyncClient] = None
         
     async def __aenter__(self):
-        self.client = httpx.AsyncClient(timeout=10.0)
+        # One long-lived HTTP/2 client: all station fetches multiplex over a
+        # kept-alive connection instead of paying a TLS handshake per tick
+        self.client = httpx.AsyncClient(
+            http2=True,
+            timeout=httpx.Timeout(10.0, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=32,
+                max_keepalive_connections=16,
+                keepalive_expiry=max(60.0, INTERVAL * 2),
+            ),
+        )
+        try:
+            # Warm DNS + TLS so the first tick doesn't pay for the handshake
+            await self.client.head(WAQI_BASE_URL)
+        except httpx.HTTPError:
+            pass
         return self
         
     async def __aexit__(self, *args):
         if self.client:
             await self.client.aclose()
     
-    async def fetch_station(self, station: str) -> Optional[Dict]:
+    async def fetch_station(self, station: str, city: str, zone_id: str) -> Optional[Reading]:
         """Fetch one WAQI station."""
         if not self.client:
             return None
         try:
-            url = f"https://api.waqi.info/feed/{station}/?token={WAQI_TOKEN}"
-            resp = await self.client.get(url)
+            resp = await self.client.get(_STATION_URL[station])
             if resp.status_code != 200:
                 return None
             data = resp.json()
@@ -78,80 +173,53 @@ class WAQIConnector:
             
             d = data["data"]
             iaqi = d.get("iaqi", {})
-            
-            def safe_float(val, fallback=0.0):
-                """WAQI sometimes returns '-' or None for missing sensor readings."""
-                try:
-                    if val in (None, "-", "", "NA", "N/A"):
-                        return fallback
-                    return float(val)
-                except (ValueError, TypeError):
-                    return fallback
-
-            def get_val(key):
-                raw = (iaqi.get(key) or {}).get("v", 0)
-                return safe_float(raw)
-
-            return {
-                "station": station,
-                "aqi": safe_float(d.get("aqi", 0)),
-                "pm25": get_val("pm25"),
-                "pm10": get_val("pm10"),
-                "no2": get_val("no2"),
-                "so2": get_val("so2"),
-                "o3": get_val("o3"),
-                "co": get_val("co"),
-                "timestamp": d.get("time", {}).get("iso", datetime.utcnow().isoformat()),
-                "city_name": d.get("city", {}).get("name", ""),
-            }
+
+            return Reading(
+                zone_id=zone_id,
+                zone_name=d.get("city", {}).get("name", ""),
+                city=city,
+                timestamp=d.get("time", {}).get("iso", datetime.utcnow().isoformat()),
+                aqi=_safe_float(d.get("aqi", 0)),
+                pm25=_iaqi_value(iaqi, "pm25"),
+                pm10=_iaqi_value(iaqi, "pm10"),
+                no2=_iaqi_value(iaqi, "no2"),
+                so2=_iaqi_value(iaqi, "so2"),
+                o3=_iaqi_value(iaqi, "o3"),
+                co=_iaqi_value(iaqi, "co"),
+            )
         except Exception as e:
             print(f"⚠️  WAQI fetch error for {station}: {e}")
             return None
     
-    async def fetch_all(self) -> pd.DataFrame:
+    async def fetch_all(self) -> List[Reading]:
         """Fetch all stations for selected cities."""
-        all_data = []
+        # Stations are independent — fetch them concurrently over the shared pool
+        results = await asyncio.gather(
+            *(
+                self.fetch_station(station, city_name, zone_id)
+                for city_name in self.cities
+                for zone_id, station in _CITY_STATIONS.get(city_name, ())
+            ),
+            return_exceptions=True,
+        )
+        readings = [r for r in results if isinstance(r, Reading)]
         
-        for city_name in self.cities:
-            if city_name not in CITIES_CONFIG:
-                continue
-            
-            city_config = CITIES_CONFIG[city_name]
-            stations = city_config["stations"]
-            
-            for i, station in enumerate(stations):
-                data = await self.fetch_station(station)
-                if data:
-                    # Estimate CO2 from AQI (India grid factor 0.82 kg/kWh)
-                    hour = datetime.now().hour
-                    time_mult = 1.7 if 7 <= hour <= 10 else 1.85 if 18 <= hour <= 21 else 1.0
-                    base_power = 500 + (data["aqi"] / 100) * 300
-                    co2 = round((base_power * time_mult / 1000) * 0.82 * 8, 2)
-                    
-                    all_data.append({
-                        "zone_id": f"{city_name[:2].upper()}{i+1}",
-                        "zone_name": data.get("city_name", station.split("/")[-1]),
-                        "city": city_name,
-                        "timestamp": data["timestamp"],
-                        "aqi": data["aqi"],
-                        "pm25": data["pm25"],
-                        "pm10": data["pm10"],
-                        "no2": data["no2"],
-                        "so2": data["so2"],
-                        "o3": data["o3"],
-                        "co": data["co"],
-                        "co2_kg_hr": co2,
-                        "data_source": "live",
-                    })
+        # Estimate CO2 from AQI (India grid factor 0.82 kg/kWh). The time-of-day
+        # multiplier is the same for the whole batch, so fold it into one factor
+        hour = datetime.now().hour
+        time_mult = 1.7 if 7 <= hour <= 10 else 1.85 if 18 <= hour <= 21 else 1.0
+        co2_factor = time_mult / 1000 * 0.82 * 8
+        for r in readings:
+            r.co2_kg_hr = round((500 + r.aqi * 3.0) * co2_factor, 2)
         
-        return pd.DataFrame(all_data) if all_data else pd.DataFrame()
+        return readings
     
     async def stream(self):
         """Continuous stream generator for Pathway."""
         while True:
-            df = await self.fetch_all()
-            if not df.empty:
-                yield df
+            readings = await self.fetch_all()
+            if readings:
+                yield readings
             await asyncio.sleep(INTERVAL)
 
 
@@ -174,40 +242,45 @@ class AsyncProcessor:
         self._running = True
         async with WAQIConnector(self.cities) as connector:
             self.connector = connector
-            async for df in connector.stream():
+            async for readings in connector.stream():
                 if not self._running:
                     break
-                yield self._process_batch(df)
+                yield self._process_batch(readings)
     
-    def _process_batch(self, df: pd.DataFrame) -> Dict:
+    def _process_batch(self, readings: List[Reading]) -> Batch:
         """Process one batch of sensor data."""
-        if df.empty:
-            return {"readings": [], "cities": {}}
+        timestamp = datetime.utcnow().isoformat()
+        if not readings:
+            return Batch(timestamp=timestamp, readings=[])
         
-        # City aggregations
-        city_stats = {}
-        for city in df["city"].unique():
-            city_df = df[df["city"] == city]
-            city_stats[city] = {
-                "total_co2": round(city_df["co2_kg_hr"].sum(), 2),
-                "avg_aqi": round(city_df["aqi"].mean(), 1),
-                "avg_pm25": round(city_df["pm25"].mean(), 1),
-                "count": len(city_df),
-                "color": CITIES_CONFIG.get(city, {}).get("color", "#7fff00"),
-                "emoji": CITIES_CONFIG.get(city, {}).get("emoji", "🌿"),
-            }
+        # City aggregations — single pass: [co2 sum, aqi sum, pm25 sum, count]
+        sums: Dict[str, List[float]] = {}
+        for r in readings:
+            s = sums.setdefault(r.city, [0.0, 0.0, 0.0, 0])
+            s[0] += r.co2_kg_hr
+            s[1] += r.aqi
+            s[2] += r.pm25
+            s[3] += 1
         
-        # Convert to records
-        readings = df.to_dict("records")
+        city_stats = {}
+        for city, (co2, aqi, pm25, n) in sums.items():
+            color, emoji = _CITY_META.get(city, _DEFAULT_META)
+            city_stats[city] = CityStats(
+                total_co2=round(co2, 2),
+                avg_aqi=round(aqi / n, 1),
+                avg_pm25=round(pm25 / n, 1),
+                count=n,
+                color=color,
+                emoji=emoji,
+            )
         
-        return {
-            "timestamp": datetime.utcnow().isoformat(),
-            "readings": readings,
-            "total_co2": round(df["co2_kg_hr"].sum(), 2),
-            "avg_aqi": round(df["aqi"].mean(), 1),
-            "cities": city_stats,
-            "data_source": "live",
-        }
+        return Batch(
+            timestamp=timestamp,
+            readings=readings,
+            total_co2=round(sum(s[0] for s in sums.values()), 2),
+            avg_aqi=round(sum(s[1] for s in sums.values()) / len(readings), 1),
+            cities=city_stats,
+        )
     
     def stop(self):
         self._running = False
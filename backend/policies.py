@@ -0,0 +1,22 @@
+"""
+GreenPulse — Policy Corpus
+Indian climate policy documents the chatbot grounds its answers in.
+"""
+
+import json
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List
+
+# Kept as data, not code: edit the JSON to change the corpus
+POLICIES_PATH = Path(__file__).parent / "data" / "policies.json"
+
+
+@lru_cache(maxsize=1)
+def load_policies() -> List[Dict]:
+    """Parse the policy corpus once per process."""
+    return json.loads(POLICIES_PATH.read_bytes())
+
+
+# ── 8 Indian Climate Policy Documents ─────────────────────────────
+POLICIES = load_policies()
@@ -5,86 +5,114 @@ No embeddings/vectors - just direct context + Gemini API
 
 import os
 import re
+import heapq
 import asyncio
-import threading
-from typing import List, Dict, AsyncGenerator, Optional
+import hashlib
+from collections import OrderedDict
+from functools import lru_cache
+from typing import List, Dict, AsyncGenerator, Optional, Tuple
 
 from langchain_google_genai import ChatGoogleGenerativeAI
 
+from backend.policies import POLICIES
 
-# ── 8 Indian Climate Policy Documents ─────────────────────────────
-POLICIES = [
-    {
-        "id": "NCAP_2019",
-        "title": "National Clean Air Programme (NCAP) 2019",
-        "content": "NCAP 2019 targets 20-30% reduction in PM2.5/PM10 by 2024 across 122 non-attainment cities including Delhi, Mumbai, Kolkata, Chennai, and Prayagraj. Key measures: Real-time CAAQMS monitoring for Tier-1 cities. Rs 4000 crore allocated. BS-VI fuel norms. EV incentives. Biomass burning ban. Industrial stack emissions tightened by 30%. Green belt target: 33% tree cover. For AQI>200: Activate GRAP immediately.",
-        "keywords": ["ncap", "clean air", "pm2.5", "pm10", "122 cities", "non attainment", "caaqms", "bs-vi", "ev", "biomass", "grap"],
-    },
-    {
-        "id": "GRAP_2023",
-        "title": "Graded Response Action Plan (GRAP) 2023",
-        "content": "GRAP emergency protocol for high pollution: Stage I (AQI 201-300): Ban biomass burning, mechanised sweeping, water sprinkling 3x/day. Stage II (AQI 301-400): Diesel genset ban, stone crushers shut, +25% public transport. Stage III (AQI 401-450): Ban BS-III petrol BS-IV diesel, schools online, heavy trucks banned. Stage IV (AQI>450): 50% WFH government, stop non-essential construction. Response: Command Centre T+0, advisory T+30min, source ID T+4hr.",
-        "keywords": ["grap", "stage", "aqi", "emergency", "biomass", "wfh", "construction", "schools", "trucks"],
-    },
-    {
-        "id": "SMART_ENERGY_2022",
-        "title": "Smart City Energy Efficiency MoHUA 2022",
-        "content": "Demand Response mandatory for industrial consumers >1MW. Time-of-use tariffs shift 15% load from 6-10PM peak. Smart meters 15-minute data for all commercial buildings. ECBC mandatory buildings >500sqm. 100% LED street lighting saves 60%. Adaptive dimming 11PM-5AM. Power Factor Controllers in substations save 8-12%. 30% city electricity from renewables by 2025. 500MW rooftop solar target Tier-1 cities.",
-        "keywords": ["energy", "smart", "demand response", "solar", "rooftop", "led", "renewable", "ecbc", "power factor"],
-    },
-    {
-        "id": "TRAFFIC_CPCB",
-        "title": "CPCB Traffic Pollution Guidelines 2023",
-        "content": "National Ambient Air Quality Standards (NAAQS): PM2.5 60μg/m³, PM10 100μg/m³ annual; 24hr: PM2.5 75μg/m³, PM10 150μg/m³. Emission factors: diesel 0.5g/km, petrol 0.2g/km, 2W 0.25g/km. Idling ban >3min enforceable. Parking pricing zones reduce 15% traffic. Metro rail corridor cuts 40% road PM. Electric bus fleet target 2027: 40% of STU buses.",
-        "keywords": ["traffic", "cpcb", "naaqs", "pm2.5", "pm10", "idling", "parking", "metro", "electric bus"],
-    },
-    {
-        "id": "GREEN_BHARAT",
-        "title": "Green Bharat Mission 2023",
-        "content": "Urban forestry target: 3 crore trees by 2026. Miyawaki mini-forests in urban areas. Lake & wetland conservation. Solar city program: 60 cities target 10% renewable. Waste-to-energy plants in 100 cities. Plastic ban: single-use plastic >50 microns. Compulsory rainwater harvesting buildings >500sqm. Urban lake revival: 150 lakes targeted. Climate-resilient infrastructure mandatory for new towns.",
-        "keywords": ["green bharat", "tree", "forest", "miyawaki", "lake", "wetland", "solar", "plastic", "rainwater"],
-    },
-    {
-        "id": "WASTE_MSW",
-        "title": "Swachh Bharat 2.0 - MSW Rules 2023",
-        "content": "Source segregation mandatory: dry/wet/marine litter. Door-to-door collection 100% towns. Bio-mining of legacy dumpsites. RDF production target 15MT/year. Landfill diversion 70% by 2025. Compost subsidy ₹1500/tonne. Incineration only for HCW/special waste. Informal sector integration in waste management. Extended Producer Responsibility for packaging.",
-        "keywords": ["waste", "msw", "segregation", "compost", "landfill", "rdf", "swachh", "dump"],
-    },
-    {
-        "id": "WATER_URBAN",
-        "title": "Urban Water Supply & Sewerage 2024",
-        "content": "Per capita water 135 lpcd mandatory. 24x7 pressure testing in all ULBs. STP reuse for gardening/industry 20% target. Rainwater harvesting mandatory all buildings >300sqm. Groundwater recharge through artificial lakes. Waste water treatment 100% coverage by 2026. Smart water meters mandatory >500 connections. Non-revenue water <20% target.",
-        "keywords": ["water", "sewerage", "stp", "rainwater", "groundwater", "meter", "non-revenue"],
-    },
-    {
-        "id": "BUILDING_ECO",
-        "title": "Eco-Niwas Samhita 2024 (Energy Conservation)",
-        "content": "ECBC 2017 mandatory all commercial >100sqm. Energy performance certificate mandatory sale/rent. Building envelope standards: U-value ≤0.4 W/m²K. Cool roof mandatory tropical climate. Solar-ready buildings 30% load. 5-star labeling mandatory appliances. LED lighting 100% by 2025. HVAC efficiency SEER ≥14. Whole-building simulation mandatory >10,000sqm.",
-        "keywords": ["building", "ecbc", "energy", "cool roof", "solar", "led", "hvac", "star", "envelope"],
-    },
-]
+# If Gemini hasn't produced a first chunk after HEDGE_DELAY seconds, race a
+# duplicate request and keep whichever streams first; HEDGE_BUDGET caps
+# hedges to that fraction of requests so a slow API isn't hit twice as hard
+HEDGE_DELAY = 0.5
+HEDGE_BUDGET = 0.05
+
+# Finished answers are kept per (question, snapshot minute) and replayed in
+# ANSWER_CHUNK-sized pieces, so repeat questions skip the LLM entirely
+ANSWER_CACHE_SIZE = 256
+ANSWER_CHUNK = 32
+
+
+# Query/title tokens: words, numbers and dotted or hyphenated terms ("pm2.5", "bs-vi")
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[.\-][a-z0-9]+)*")
+
+
+def _build_policy_index():
+    """
+    Invert POLICIES into token -> bitmask maps (bit i set = POLICIES[i]).
+    Multi-word keywords can't be looked up per token, so they get their
+    own phrase -> bitmask map, matched against the raw question.
+    """
+    title_index: Dict[str, int] = {}
+    keyword_index: Dict[str, int] = {}
+    phrases: Dict[str, int] = {}
+    for i, p in enumerate(POLICIES):
+        bit = 1 << i
+        for tok in set(_TOKEN_RE.findall(p["title"].lower())):
+            title_index[tok] = title_index.get(tok, 0) | bit
+        for kw in p.get("keywords", []):
+            target = keyword_index if _TOKEN_RE.fullmatch(kw) else phrases
+            target[kw] = target.get(kw, 0) | bit
+    return title_index, keyword_index, phrases
+
+
+_TITLE_INDEX, _KEYWORD_INDEX, _PHRASE_INDEX = _build_policy_index()
+
+# Keywords are written as stems ("tree", "meter") for substring matching, so
+# each query token is looked up by its prefixes of these lengths too
+_KEYWORD_LENGTHS = sorted({len(kw) for kw in _KEYWORD_INDEX})
+
+# Per-policy prompt block, formatted once instead of on every question
+_POLICY_CONTEXT = {p["id"]: f"[{p['title']}]\n{p['content']}" for p in POLICIES}
+
+
+def _add_score(scores: List[int], mask: int, weight: int) -> None:
+    """Add weight to every policy whose bit is set in mask."""
+    while mask:
+        low = mask & -mask
+        scores[low.bit_length() - 1] += weight
+        mask ^= low
 
 
 def _match_policies(question: str, max_docs: int = 3) -> List[Dict]:
     """
     Simple keyword-based policy matching.
     No embeddings/vectors - just string matching.
+
+    Plurals and inflections still hit stem keywords:
+    >>> [p["id"] for p in _match_policies("How do lakes help?")]
+    ['GREEN_BHARAT']
+    >>> [p["id"] for p in _match_policies("Tell me about forests in cities")]
+    ['GREEN_BHARAT']
+    >>> [p["id"] for p in _match_policies("How many trees will be planted?")]
+    ['GREEN_BHARAT']
+    >>> [p["id"] for p in _match_policies("What are the rules for new buildings?")]
+    ['WASTE_MSW', 'BUILDING_ECO']
+    >>> [p["id"] for p in _match_policies("What about smart meters?")]
+    ['SMART_ENERGY_2022', 'WATER_URBAN']
     """
-    q = question.lower()
-    scored = []
-    for p in POLICIES:
-        score = 0
-        title_words = p["title"].lower().split()
-        for w in title_words:
-            if w in q:
-                score += 3
-        for kw in p.get("keywords", []):
-            if kw in q:
-                score += 2
-        if score > 0:
-            scored.append((score, p))
-    scored.sort(reverse=True)
-    return [p for _, p in scored[:max_docs]]
+    return list(_match_policies_cached(question.strip().lower(), max_docs))
+
+
+@lru_cache(maxsize=512)
+def _match_policies_cached(q: str, max_docs: int) -> Tuple[Dict, ...]:
+    """Scoring behind _match_policies, memoized on the normalized question."""
+    scores = [0] * len(POLICIES)
+    keywords = set()  # each keyword counts once, however many tokens it prefixes
+    for tok in set(_TOKEN_RE.findall(q)):
+        _add_score(scores, _TITLE_INDEX.get(tok, 0), 3)
+        for n in _KEYWORD_LENGTHS:
+            if n > len(tok):
+                break
+            if tok[:n] in _KEYWORD_INDEX:
+                keywords.add(tok[:n])
+    for kw in keywords:
+        _add_score(scores, _KEYWORD_INDEX[kw], 2)
+    # Few phrases, so a substring test each keeps `kw in q` semantics exactly,
+    # including phrases that overlap or share a prefix
+    for phrase, mask in _PHRASE_INDEX.items():
+        if phrase in q:
+            _add_score(scores, mask, 2)
+    # Partial top-k; ties keep POLICIES order
+    ranked = heapq.nlargest(
+        max_docs, (i for i, score in enumerate(scores) if score), key=lambda i: (scores[i], -i)
+    )
+    return tuple(POLICIES[i] for i in ranked)
 
 
 class LangchainRAG:
@@ -98,7 +126,24 @@ class LangchainRAG:
         self._ready = False
         self._init_error: Optional[str] = None
         self._init_stage: str = "starting"
-        threading.Thread(target=self._init, daemon=True).start()
+        self._live_ctx_cache: Optional[Tuple[str, str]] = None  # (snapshot timestamp, context)
+        self._llm_requests = 0
+        self._llm_hedges = 0
+        self._answer_cache: "OrderedDict[str, str]" = OrderedDict()
+        self._init_done = asyncio.Event()  # set once _init finishes, ok or not
+        self._init_task: Optional[asyncio.Task] = None
+
+    def start(self) -> asyncio.Task:
+        """Schedule _init in the default executor; idempotent, call from the event loop."""
+        if self._init_task is None:
+            self._init_task = asyncio.get_running_loop().create_task(self._run_init())
+        return self._init_task
+
+    async def _run_init(self):
+        try:
+            await asyncio.to_thread(self._init)
+        finally:
+            self._init_done.set()
 
     def _init(self):
         try:
@@ -125,6 +170,11 @@ class LangchainRAG:
             self._init_stage = "error"
 
     def _build_live_context(self, live: Dict) -> str:
+        # Snapshots only change once per stream tick, so every question
+        # asked against the same batch reuses the string built for it
+        key = live.get("timestamp")
+        if key is not None and self._live_ctx_cache and self._live_ctx_cache[0] == key:
+            return self._live_ctx_cache[1]
         cities = live.get("cities", {})
         city_lines = "\n".join(
             f"  • {name}: CO₂ {d.get('total_co2', 0):.1f} kg/hr | "
@@ -132,13 +182,13 @@ class LangchainRAG:
             for name, d in cities.items()
         )
         readings = live.get("readings", [])
-        top = sorted(readings, key=lambda x: x.get("co2_kg_hr", 0), reverse=True)[:3]
+        top = heapq.nlargest(3, readings, key=lambda x: x.get("co2_kg_hr", 0))
         top_lines = "\n".join(
             f"  {i+1}. {z['zone_name']} ({z['city']}): "
             f"CO₂={z['co2_kg_hr']:.1f} AQI={z['aqi']:.0f}"
             for i, z in enumerate(top)
         )
-        return (
+        context = (
             f"=== LIVE WAQI/CPCB SENSOR DATA ===\n"
             f"Timestamp: {live.get('timestamp', 'now')}\n\n"
             f"City Summary:\n{city_lines}\n\n"
@@ -146,30 +196,42 @@ class LangchainRAG:
             f"Avg AQI = {live.get('avg_aqi', 0):.0f}\n\n"
             f"Top Emitting Zones:\n{top_lines}"
         )
+        self._live_ctx_cache = (key, context)
+        return context
 
     async def query_stream(self, question: str, live: Dict) -> AsyncGenerator[str, None]:
         import time
+        key = hashlib.sha1(
+            f"{question.strip().lower()}|{live.get('timestamp', '')[:16]}".encode()
+        ).hexdigest()
+        cached = self._answer_cache.get(key)
+        if cached is not None:
+            self._answer_cache.move_to_end(key)
+            for i in range(0, len(cached), ANSWER_CHUNK):
+                yield cached[i:i + ANSWER_CHUNK]
+                await asyncio.sleep(0)
+            return
+
+        self.start()
         start_time = time.time()
         timeout = 60
-        last_progress = -10
-        elapsed = 0
 
-        while not self._ready and elapsed < timeout:
+        while not self._init_done.is_set():
             elapsed = time.time() - start_time
+            if elapsed >= timeout:
+                break
 
-            if self._init_error:
-                yield f"❌ RAG initialization failed: {self._init_error[:200]}...\n"
-                return
-
-            if int(elapsed) - last_progress >= 5:
-                stage_msg = {
-                    "starting": "Initializing...",
-                    "loading_llm": "Loading language model..."
-                }.get(self._init_stage, f"Working... ({self._init_stage})")
-                yield f"⏳ {stage_msg} ({int(elapsed)}s elapsed)\n"
-                last_progress = int(elapsed)
+            stage_msg = {
+                "starting": "Initializing...",
+                "loading_llm": "Loading language model..."
+            }.get(self._init_stage, f"Working... ({self._init_stage})")
+            yield f"⏳ {stage_msg} ({int(elapsed)}s elapsed)\n"
 
-            await asyncio.sleep(1.0)
+            # Sleep until _init finishes or the next progress line is due
+            try:
+                await asyncio.wait_for(self._init_done.wait(), timeout=min(5.0, timeout - elapsed))
+            except asyncio.TimeoutError:
+                pass
 
         if not self._ready:
             if self._init_error:
@@ -179,10 +241,7 @@ class LangchainRAG:
             return
 
         matched = _match_policies(question)
-        policy_ctx = "\n\n".join(
-            f"[{p['title']}]\n{p['content']}"
-            for p in matched
-        )
+        policy_ctx = "\n\n".join(_POLICY_CONTEXT[p["id"]] for p in matched)
 
         prompt = (
             "You are GreenPulse AI — real-time carbon intelligence for Indian cities.\n"
@@ -199,12 +258,62 @@ class LangchainRAG:
             yield "⚠️ Gemini not initialized. Add GOOGLE_API_KEY to enable AI responses.\n"
             return
 
+        parts = []
         try:
-            async for chunk in self.llm.astream(prompt):
+            async for chunk in self._hedged_astream(prompt):
                 if hasattr(chunk, "content") and chunk.content:
+                    parts.append(chunk.content)
                     yield chunk.content
         except Exception as e:
             yield f"⚠️ Gemini error: {e}\n"
+            return
+
+        # Only complete, successful answers are cached
+        if parts:
+            self._answer_cache[key] = "".join(parts)
+            if len(self._answer_cache) > ANSWER_CACHE_SIZE:
+                self._answer_cache.popitem(last=False)
+
+    async def _hedged_astream(self, prompt: str):
+        """self.llm.astream(prompt), hedged with a second request on a slow first chunk."""
+        self._llm_requests += 1
+        primary = self.llm.astream(prompt)
+        pending = {asyncio.ensure_future(primary.__anext__()): primary}
+        winner, first, error = None, None, None
+        try:
+            done, _ = await asyncio.wait(pending, timeout=HEDGE_DELAY)
+            if not done and self._llm_hedges < HEDGE_BUDGET * self._llm_requests:
+                self._llm_hedges += 1
+                backup = self.llm.astream(prompt)
+                pending[asyncio.ensure_future(backup.__anext__())] = backup
+
+            while pending and winner is None:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    stream = pending.pop(task)
+                    if winner is None and task.exception() is None:
+                        winner, first = stream, task.result()
+                    else:
+                        error = error or task.exception()
+                        await stream.aclose()
+        finally:
+            # Cancel the losing attempt before its stream is closed
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            for stream in pending.values():
+                await stream.aclose()
+
+        if winner is None:
+            if isinstance(error, StopAsyncIteration):
+                return
+            raise error
+        try:
+            yield first
+            async for chunk in winner:
+                yield chunk
+        finally:
+            await winner.aclose()
 
     def get_sources(self, question: str) -> List[Dict]:
         matched = _match_policies(question)
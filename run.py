@@ -0,0 +1,28 @@
+"""
+GreenPulse — Local launcher
+Loads .env, then serves backend.main:app on uvloop + httptools
+with permessage-deflate websocket compression
+"""
+
+import os
+import sys
+
+import uvicorn
+from dotenv import load_dotenv
+
+if __name__ == "__main__":
+    # Must run before backend.main is imported — config is read at import time
+    load_dotenv()
+
+    uvicorn.run(
+        "backend.main:app",
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8000")),
+        # uvloop has no Windows build; fall back to the stdlib loop there
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
+        http="httptools",
+        # Batch frames repeat the same field names for every station and
+        # deflate to a fraction of their size; browsers negotiate it
+        ws="websockets",
+        ws_per_message_deflate=True,
+    )